@@ -10,7 +10,6 @@ import numpy as np
 import soundfile as sf
 import noisereduce as nr
 import faiss
-import tempfile
 from pedalboard import (
     Pedalboard,
     Chorus,
@@ -31,6 +30,7 @@ sys.path.append(now_dir)
 from rvc.infer.pipeline import Pipeline as VC
 from rvc.lib.utils import load_audio_infer, load_embedding
 from rvc.lib.tools.split_audio import process_audio, merge_audio
+from rvc.lib.tools.uvcp import load_uvcp
 from rvc.lib.algorithm.synthesizers import Synthesizer
 from rvc.configs.config import Config
 
@@ -64,6 +64,7 @@ class VoiceConverter:
         self.use_f0 = None  # Whether the model uses F0
         self.loaded_model = None
         self.serialized_index_data = None # Holds serialized index from .uvcp
+        self.uvcp_index_path = None # Sidecar index file of an uncompressed .uvcp
 
     def load_hubert(self, embedder_model: str, embedder_model_custom: str = None):
         """
@@ -253,22 +254,11 @@ class VoiceConverter:
             return
 
         self.get_vc(model_path, sid)
-        
-        temp_index_path = None
-        final_index_path = index_path
 
         try:
             start_time = time.time()
             print(f"Converting audio '{audio_input_path}'...")
 
-            # Handle index from .uvcp file
-            if self.serialized_index_data:
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".index") as fp:
-                    index = faiss.deserialize_index(self.serialized_index_data)
-                    faiss.write_index(index, fp.name)
-                    temp_index_path = fp.name
-                    final_index_path = temp_index_path
-
             audio = load_audio_infer(
                 audio_input_path,
                 16000,
@@ -284,15 +274,23 @@ class VoiceConverter:
                 self.last_embedder_model = embedder_model
 
             file_index = (
-                final_index_path.strip()
+                index_path.strip()
                 .strip('"')
                 .strip("\n")
                 .strip('"')
                 .strip()
                 .replace("trained", "added")
-                if final_index_path and os.path.exists(final_index_path) else ""
+                if index_path and os.path.exists(index_path) else ""
             )
 
+            # Indexes from a .uvcp file are used as-is, without the "trained" -> "added" mapping.
+            # A serialized one is read straight from the loaded bytes and handed to the
+            # pipeline as an index object, no temporary .index file involved.
+            if self.uvcp_index_path:
+                file_index = self.uvcp_index_path
+            elif self.serialized_index_data is not None and index_rate > 0:
+                file_index = faiss.deserialize_index(self.serialized_index_data)
+
             if self.tgt_sr != resample_sr >= 16000:
                 self.tgt_sr = resample_sr
 
@@ -361,10 +359,6 @@ class VoiceConverter:
         except Exception as error:
             print(f"An error occurred during audio conversion: {error}")
             print(traceback.format_exc())
-        finally:
-            # Clean up temporary index file if it was created
-            if temp_index_path and os.path.exists(temp_index_path):
-                os.remove(temp_index_path)
 
     def convert_audio_batch(
         self,
@@ -464,6 +458,7 @@ class VoiceConverter:
                 torch.cuda.empty_cache()
         
         self.serialized_index_data = None
+        self.uvcp_index_path = None
         del self.net_g, self.cpt
         if torch.cuda.is_available():
             torch.cuda.empty_cache()
@@ -478,6 +473,7 @@ class VoiceConverter:
         """
         self.cpt = None
         self.serialized_index_data = None
+        self.uvcp_index_path = None
 
         if not os.path.isfile(weight_root):
             print(f"Model file not found: {weight_root}")
@@ -485,9 +481,10 @@ class VoiceConverter:
         
         if weight_root.endswith(".uvcp"):
             print(f"Loading .uvcp file: {weight_root}")
-            uvcp_data = torch.load(weight_root, map_location="cpu")
+            uvcp_data = load_uvcp(weight_root)
             self.cpt = uvcp_data.get("model_state")
             self.serialized_index_data = uvcp_data.get("index_data")
+            self.uvcp_index_path = uvcp_data.get("index_path")
         else:
             print(f"Loading .pth file: {weight_root}")
             self.cpt = torch.load(weight_root, map_location="cpu", weights_only=True)
@@ -549,7 +549,7 @@ class Pipeline:
             input_audio_path: Path to the input audio file.
             pitch: Key to adjust the pitch of the F0 contour.
             f0_method: Method to use for F0 estimation.
-            file_index: Path to the FAISS index file for speaker embedding retrieval.
+            file_index: Path to the FAISS index file (or an already loaded FAISS index) for speaker embedding retrieval.
             index_rate: Blending rate for speaker embedding retrieval.
             pitch_guidance: Whether to use pitch guidance during voice conversion.
             filter_radius: Radius for median filtering the F0 contour.
@@ -563,9 +563,12 @@ class Pipeline:
             f0_file: Path to a file containing an F0 contour to use.
         """
         # Index handling
-        if file_index != "" and os.path.exists(file_index) and index_rate > 0:
+        index_loaded = isinstance(file_index, faiss.Index)
+        if index_rate > 0 and (
+            index_loaded or (file_index != "" and os.path.exists(file_index))
+        ):
             try:
-                index = faiss.read_index(file_index)
+                index = file_index if index_loaded else faiss.read_index(file_index)
                 big_npy = index.reconstruct_n(0, index.ntotal)
             except Exception as error:
                 print(f"An error occurred reading the FAISS index: {error}")
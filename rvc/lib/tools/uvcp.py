@@ -0,0 +1,415 @@
+import gzip
+import io
+import json
+import os
+import shutil
+import struct
+import sys
+import traceback
+from pathlib import Path
+
+import lz4.frame
+import numpy as np
+import torch
+import zstandard as zstd
+from safetensors import safe_open
+from safetensors.torch import save_file
+
+# .uvcp files are a torch.save payload, either wrapped in a single zstd, lz4 or gzip
+# stream or stored as a plain torch zip ("none") that can be memory-mapped on load.
+# The codec is told apart by the leading magic bytes, so the loader never guesses.
+# "safetensors" packages keep the weights as a safetensors file and every other
+# checkpoint field as JSON in its metadata, so loading never goes through pickle.
+# A FAISS index, if any, is copied byte for byte from the .index file right after a
+# compressed payload and located through a fixed-size trailer:
+# (payload length, index length, INDEX_MAGIC).
+# Uncompressed packages keep it in a raw FAISS sidecar ("<name>.uvcp.faiss") instead,
+# so neither file needs to be parsed or copied to be mapped into memory.
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+LZ4_MAGIC = b"\x04\x22\x4d\x18"
+GZIP_MAGIC = b"\x1f\x8b"
+ZIP_MAGIC = b"PK\x03\x04"
+INDEX_MAGIC = b"UVCPIDX1"
+INDEX_TRAILER = struct.Struct("<QQ8s")
+
+# Default output folder for packages, resolved once instead of on every call.
+LOGS_DIR = Path(__file__).resolve().parents[3] / "logs"
+LOGS_DIR.mkdir(parents=True, exist_ok=True)
+
+SHUFFLE_DTYPES = (torch.float16, torch.bfloat16, torch.float32)
+CAST_DTYPES = {"fp16": torch.float16, "bf16": torch.bfloat16}
+# Older packages pickle the faiss index as a numpy array, which weights_only loading rejects.
+LEGACY_SAFE_GLOBALS = [
+    np.core.multiarray._reconstruct,
+    np.ndarray,
+    np.dtype,
+    type(np.dtype(np.uint8)),
+]
+
+
+def _zstd_writer(raw):
+    # Multithreaded zstd keeps every core busy instead of a single DEFLATE thread.
+    cctx = zstd.ZstdCompressor(level=3, threads=-1)
+    return cctx.stream_writer(raw, closefd=False, write_return_read=True)
+
+
+def _lz4_writer(raw):
+    # 4 MB linked blocks give lz4 more history per block; the frame
+    # checksum only costs a second pass over multi-GB payloads.
+    return lz4.frame.open(
+        raw,
+        mode="wb",
+        block_size=lz4.frame.BLOCKSIZE_MAX4MB,
+        block_linked=True,
+        content_checksum=False,
+        compression_level=0,
+    )
+
+
+def _zstd_reader(fh):
+    dctx = zstd.ZstdDecompressor()
+    return dctx.stream_reader(fh)
+
+
+COMPRESSORS = {
+    "zstd": _zstd_writer,
+    "lz4": _lz4_writer,
+    "gzip": lambda raw: gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6),
+}
+DECOMPRESSORS = {
+    "zstd": _zstd_reader,
+    "lz4": lambda fh: lz4.frame.open(fh, mode="rb"),
+    "gzip": lambda fh: gzip.open(fh, "rb"),
+}
+MAGICS = {"zstd": ZSTD_MAGIC, "lz4": LZ4_MAGIC, "gzip": GZIP_MAGIC, "none": ZIP_MAGIC}
+CODECS = ("zstd", "lz4", "gzip", "none", "safetensors")
+# lz4 gains nothing from byte planes and runs several times slower on them.
+SHUFFLE_CODECS = ("zstd", "gzip")
+
+
+def _detect_codec(header):
+    """Return the codec of a package from its first 9 bytes, None for legacy pickles."""
+    for codec, magic in MAGICS.items():
+        if header.startswith(magic):
+            return codec
+    # safetensors starts with a little-endian u64 header size, then the JSON header.
+    if len(header) == 9 and header[8:9] == b"{":
+        return "safetensors"
+    return None
+
+
+def _open_output(path, size_hint):
+    """
+    Open path for writing with a large buffer, reserving size_hint bytes up front on Linux
+    so the file lands in few extents. Callers truncate to the final size.
+    """
+    fd = os.open(
+        str(path),
+        os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0),
+        0o644,
+    )
+    # Where the kernel can't reserve the space itself, libc emulates posix_fallocate by
+    # writing zeros over the whole range, doubling the bytes written before the truncate.
+    # Linux reserves natively on ext4, xfs, btrfs and tmpfs, so the call is limited to it;
+    # on Linux filesystems without support (FAT, some network mounts) that extra write is
+    # the price of the preallocation.
+    if sys.platform.startswith("linux"):
+        try:
+            os.posix_fallocate(fd, 0, size_hint)
+        except OSError:
+            # Not every filesystem supports preallocation; writing still works without it.
+            pass
+    return os.fdopen(fd, "wb", buffering=8 * 1024 * 1024)
+
+
+def _load_checkpoint(pth_path):
+    """torch.load a .pth with its tensors memory-mapped, so pages are read in on demand."""
+    try:
+        return torch.load(pth_path, map_location="cpu", weights_only=True, mmap=True)
+    except (TypeError, RuntimeError):
+        # torch < 2.1 has no mmap argument and legacy (non-zip) checkpoints can't be mapped.
+        return torch.load(pth_path, map_location="cpu", weights_only=True)
+
+
+def _save_safetensors(checkpoint, path):
+    """Write checkpoint["weight"] as safetensors with the remaining fields as metadata."""
+    weights = {key: value.contiguous() for key, value in checkpoint["weight"].items()}
+    info = {key: value for key, value in checkpoint.items() if key != "weight"}
+    save_file(weights, str(path), metadata={"uvcp_checkpoint": json.dumps(info)})
+
+
+def _load_safetensors(path):
+    """Invert _save_safetensors; the weights stay backed by the mapped file."""
+    with safe_open(str(path), framework="pt") as f:
+        checkpoint = json.loads(f.metadata()["uvcp_checkpoint"])
+        checkpoint["weight"] = {key: f.get_tensor(key) for key in f.keys()}
+    return checkpoint
+
+
+# The tensor walkers below replace dict entries in place, so each original tensor is
+# released as soon as its replacement exists and peak memory stays near one model
+# instead of the original plus a full converted copy.
+
+
+def _cast_state(value, dtype):
+    """Cast every floating point tensor in a checkpoint to dtype."""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            value[key] = _cast_state(item, dtype)
+        return value
+    if isinstance(value, torch.Tensor) and torch.is_floating_point(value):
+        return value.to(dtype)
+    return value
+
+
+def _shuffle_bytes(value):
+    """Replace float tensors with their byte planes so the compressor sees aligned runs."""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            value[key] = _shuffle_bytes(item)
+        return value
+    if isinstance(value, torch.Tensor) and value.dtype in SHUFFLE_DTYPES:
+        flat = value.detach().contiguous().reshape(-1)
+        planes = flat.view(torch.uint8).view(flat.numel(), flat.element_size())
+        return {
+            "__shuffled__": True,
+            "dtype": str(value.dtype),
+            "shape": list(value.shape),
+            "bytes": planes.t().contiguous(),
+        }
+    return value
+
+
+def _unshuffle_bytes(value):
+    """Invert _shuffle_bytes, restoring the original tensors."""
+    if isinstance(value, dict):
+        if value.get("__shuffled__"):
+            dtype = getattr(torch, value["dtype"].split(".")[-1])
+            planes = value["bytes"].t().contiguous()
+            return planes.view(dtype).reshape(value["shape"])
+        for key, item in value.items():
+            value[key] = _unshuffle_bytes(item)
+        return value
+    return value
+
+
+class _CountingWriter:
+    """Pass-through writer that keeps track of how many bytes went into the stream."""
+
+    def __init__(self, f):
+        self.f = f
+        self.count = 0
+
+    def write(self, data):
+        self.f.write(data)
+        size = memoryview(data).nbytes
+        self.count += size
+        return size
+
+    def flush(self):
+        self.f.flush()
+
+
+def _write_payload(f, uvcp_data, index_path=None):
+    """
+    torch.save uvcp_data into f, or copy it verbatim when it is the path of a .pth file,
+    followed by the index section when an index file is given.
+    """
+    counter = _CountingWriter(f)
+    if isinstance(uvcp_data, dict):
+        torch.save(uvcp_data, counter)
+    else:
+        with open(uvcp_data, "rb") as src:
+            shutil.copyfileobj(src, counter, 4 * 1024 * 1024)
+    if not index_path:
+        return
+
+    # An .index file already is a serialized FAISS index, so it is copied as-is.
+    payload_len = counter.count
+    with open(index_path, "rb") as src:
+        shutil.copyfileobj(src, counter, 4 * 1024 * 1024)
+    f.write(INDEX_TRAILER.pack(payload_len, counter.count - payload_len, INDEX_MAGIC))
+
+
+def _read_trailer(view):
+    """Return (payload length, index length) if view ends with an index trailer."""
+    if len(view) < INDEX_TRAILER.size:
+        return None
+    payload_len, index_len, magic = INDEX_TRAILER.unpack_from(
+        view, len(view) - INDEX_TRAILER.size
+    )
+    if magic != INDEX_MAGIC:
+        return None
+    return payload_len, index_len
+
+
+def _sidecar_path(uvcp_path):
+    uvcp_path = Path(uvcp_path)
+    return uvcp_path.with_name(uvcp_path.name + ".faiss")
+
+
+def create_uvcp(
+    pth_path,
+    index_path=None,
+    output_path=None,
+    codec="zstd",
+    byte_shuffle=True,
+    dtype=None,
+):
+    """Create .uvcp file with properly serialized FAISS index and return a status message."""
+    try:
+        if not Path(pth_path).exists():
+            return f"Error: PTH file not found: {pth_path}"
+
+        if index_path and not Path(index_path).exists():
+            return f"Error: Index file not found: {index_path}"
+
+        if codec not in CODECS:
+            return f"Error: Unsupported codec: {codec}"
+
+        if dtype and dtype not in CAST_DTYPES:
+            return f"Error: Unsupported dtype: {dtype}"
+
+        byte_shuffle = byte_shuffle and codec in SHUFFLE_CODECS
+
+        # Without a cast or a byte shuffle the tensors would come out unchanged, so the
+        # .pth is carried over byte for byte instead of being unpickled and re-saved.
+        passthrough = not dtype and codec != "safetensors" and not byte_shuffle
+
+        pth_data = None
+        if passthrough:
+            uvcp_data = pth_path
+        else:
+            pth_data = _load_checkpoint(pth_path)
+            # Inference runs fine at half precision, so fp32 weights only cost size and I/O.
+            if dtype:
+                pth_data = _cast_state(pth_data, CAST_DTYPES[dtype])
+            uvcp_data = {"model_state": pth_data}
+
+        # If a custom output path is provided by the user, use it.
+        if output_path:
+            final_output_path = Path(output_path)
+            final_output_path.parent.mkdir(parents=True, exist_ok=True)
+        else:
+            # Create the new filename based on the input .pth file.
+            base_name = Path(pth_path).stem
+            uvcp_filename = f"{base_name}.uvcp"
+            final_output_path = LOGS_DIR / uvcp_filename
+
+        # The package is at most about as large as its inputs, so that bounds the reservation.
+        size_hint = Path(pth_path).stat().st_size
+        if index_path:
+            size_hint += Path(index_path).stat().st_size
+
+        # Both files are written next to their targets and moved into place at the end,
+        # so a source .pth given as the output path is never truncated while it is still
+        # being read, and a failed write leaves no half-written package behind.
+        sidecar_path = _sidecar_path(final_output_path)
+        tmp_output_path = final_output_path.with_name(final_output_path.name + ".tmp")
+        tmp_sidecar_path = sidecar_path.with_name(sidecar_path.name + ".tmp")
+        has_sidecar = bool(index_path) and codec in ("none", "safetensors")
+
+        try:
+            if codec == "none":
+                # Weights barely shrink under compression; a raw zip can be mmapped on load.
+                if passthrough:
+                    shutil.copyfile(pth_path, tmp_output_path)
+                else:
+                    with _open_output(tmp_output_path, size_hint) as raw:
+                        _write_payload(raw, uvcp_data)
+                        raw.truncate()
+            elif codec == "safetensors":
+                _save_safetensors(uvcp_data["model_state"], tmp_output_path)
+            else:
+                # Interleaved float bytes look random to the compressor; planes of
+                # exponent/mantissa bytes do not. Only worth it when compressing.
+                if byte_shuffle:
+                    uvcp_data["model_state"] = _shuffle_bytes(uvcp_data["model_state"])
+
+                with _open_output(tmp_output_path, size_hint) as raw:
+                    with COMPRESSORS[codec](raw) as cf:
+                        # torch.save emits many small writes per tensor; batch them before
+                        # they reach the compressor.
+                        f = io.BufferedWriter(cf, buffer_size=4 * 1024 * 1024)
+                        _write_payload(f, uvcp_data, index_path)
+                        f.flush()
+                        f.detach()
+                    # Hand back the part of the reservation the compressed output did not use.
+                    raw.truncate()
+
+            if has_sidecar:
+                shutil.copyfile(index_path, tmp_sidecar_path)
+
+            # Release the memory-mapped source before it may be replaced.
+            uvcp_data = pth_data = None
+
+            os.replace(tmp_output_path, final_output_path)
+            if has_sidecar:
+                os.replace(tmp_sidecar_path, sidecar_path)
+            else:
+                # Drop a sidecar left over from an earlier package so it is not picked up on load.
+                sidecar_path.unlink(missing_ok=True)
+        finally:
+            tmp_output_path.unlink(missing_ok=True)
+            tmp_sidecar_path.unlink(missing_ok=True)
+
+        return f"Successfully created UVCP file: {final_output_path}"
+    except Exception as e:
+        return f"An error occurred during UVCP creation: {e}\n{traceback.format_exc()}"
+
+
+def load_uvcp(uvcp_path):
+    """
+    Load a .uvcp file and return its dict with 'model_state' and either 'index_data'
+    (serialized index) or 'index_path' (sidecar index file), if the package has an index.
+    """
+    with open(uvcp_path, "rb") as fh, torch.serialization.safe_globals(
+        LEGACY_SAFE_GLOBALS
+    ):
+        codec = _detect_codec(fh.read(9))
+        fh.seek(0)
+        index_data = None
+        if codec == "safetensors":
+            uvcp_data = {"model_state": _load_safetensors(uvcp_path)}
+        elif codec == "none":
+            # mmap only works against a real file, so hand torch the path itself.
+            uvcp_data = torch.load(uvcp_path, map_location="cpu", mmap=True)
+        elif codec in DECOMPRESSORS:
+            # torch.load needs a seekable stream, so the frame is inflated into memory first.
+            buffer = io.BytesIO()
+            with DECOMPRESSORS[codec](fh) as f:
+                shutil.copyfileobj(f, buffer, 4 * 1024 * 1024)
+            view = buffer.getbuffer()
+            trailer = _read_trailer(view)
+            if trailer is not None:
+                # Copy the index out and cut the buffer down to the payload, so torch
+                # sees a zip without trailing data and the index does not keep the
+                # inflated buffer alive after loading.
+                payload_len, index_len = trailer
+                index_data = np.frombuffer(
+                    view, dtype=np.uint8, count=index_len, offset=payload_len
+                ).copy()
+                del view
+                buffer.truncate(payload_len)
+            else:
+                del view
+            buffer.seek(0)
+            uvcp_data = torch.load(buffer, map_location="cpu")
+            del buffer
+        else:
+            uvcp_data = torch.load(fh, map_location="cpu")
+
+    # Packages carried over from a .pth hold the bare checkpoint.
+    if "model_state" not in uvcp_data:
+        uvcp_data = {"model_state": uvcp_data}
+
+    uvcp_data["model_state"] = _unshuffle_bytes(uvcp_data["model_state"])
+
+    if index_data is not None:
+        uvcp_data["index_data"] = index_data
+
+    sidecar_path = _sidecar_path(uvcp_path)
+    if uvcp_data.get("index_data") is None and sidecar_path.is_file():
+        uvcp_data["index_path"] = str(sidecar_path)
+
+    return uvcp_data
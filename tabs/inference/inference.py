@@ -12,6 +12,7 @@ from core import (
 )
 
 from rvc.lib.utils import format_title
+from rvc.lib.tools.uvcp import load_uvcp
 from tabs.settings.sections.restart import stop_infer
 
 now_dir = os.getcwd()
@@ -339,7 +340,7 @@ def get_speakers_id(model):
         return [0]
     try:
         if model.endswith(".uvcp"):
-            model_data = torch.load(os.path.join(now_dir, model), map_location="cpu")
+            model_data = load_uvcp(os.path.join(now_dir, model))
             model_data = model_data.get("model_state", {})
         else:
             model_data = torch.load(os.path.join(now_dir, model), map_location="cpu", weights_only=True)
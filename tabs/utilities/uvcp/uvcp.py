@@ -1,25 +1,36 @@
-import torch
-from pathlib import Path
-import faiss
+import os
+import sys
 import gradio as gr
 import traceback
 
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+
+from rvc.lib.tools.uvcp import create_uvcp
+
 # --- Gardio stuff start ---
 
-def run_create_uvcp_script(pth_file, index_file, output_path):
+def run_create_uvcp_script(
+    pth_file, index_file, output_path, codec, byte_shuffle, dtype
+):
     if not pth_file:
         return "Error: A .pth file is required."
 
     try:
-        # Get the temporary file paths from the Gradio File components
-        pth_path = pth_file.name
+        # The File components hand over plain file paths
+        pth_path = pth_file
         # The index file is optional, so it might be None
-        index_path = index_file.name if index_file else None
+        index_path = index_file if index_file else None
 
         # The output path is also optional, an empty string should be treated as None
         output_path = output_path if output_path else None
 
-        return create_uvcp(pth_path, index_path, output_path)
+        # "native" keeps the checkpoint's own precision
+        dtype = None if dtype == "native" else dtype
+
+        return create_uvcp(
+            pth_path, index_path, output_path, codec, byte_shuffle, dtype
+        )
     except Exception as e:
         return f"An unexpected error occurred: {e}\n{traceback.format_exc()}"
 
@@ -36,10 +47,14 @@ def uvcp_tab():
         pth_input = gr.File(
             label="Upload PTH File",
             file_types=[".pth"],
+            type="filepath",
+            file_count="single",
         )
         index_input = gr.File(
             label="Upload Index File (Optional)",
             file_types=[".index"],
+            type="filepath",
+            file_count="single",
         )
         output_path_input = gr.Textbox(
             label="Output File Path (Optional)",
@@ -47,6 +62,26 @@ def uvcp_tab():
             placeholder="e.g., C:/logs/my_model.uvcp",
             interactive=True,
         )
+        codec_input = gr.Radio(
+            label="Codec",
+            info="- **zstd**: Smaller file, multithreaded compression. \n- **lz4**: Fastest compression, slightly larger file. \n- **gzip**: Widely supported, single-threaded and slow. \n- **none**: Larger file, fastest to save and memory-mapped on load. The index is saved next to it as a `.uvcp.faiss` file. \n- **safetensors**: Like 'none', but the weights are stored as safetensors and load without unpickling.",
+            choices=["zstd", "lz4", "gzip", "none", "safetensors"],
+            value="zstd",
+            interactive=True,
+        )
+        byte_shuffle_input = gr.Checkbox(
+            label="Byte Shuffle",
+            info="Split float weights into byte planes before compressing for a better ratio. Only used by zstd and gzip.",
+            value=True,
+            interactive=True,
+        )
+        dtype_input = gr.Radio(
+            label="Weights Precision",
+            info="- **native**: Keep the precision stored in the .pth file. \n- **fp16** / **bf16**: Cast float weights to half precision for a smaller file.",
+            choices=["native", "fp16", "bf16"],
+            value="native",
+            interactive=True,
+        )
         uvcp_output_info = gr.Textbox(
             label="Output Information",
             info="The result of the operation will be displayed here.",
@@ -58,55 +93,20 @@ def uvcp_tab():
         
         uvcp_create_button.click(
             fn=run_create_uvcp_script,
-            inputs=[pth_input, index_input, output_path_input],
+            inputs=[
+                pth_input,
+                index_input,
+                output_path_input,
+                codec_input,
+                byte_shuffle_input,
+                dtype_input,
+            ],
             outputs=[uvcp_output_info],
         )
 
 # --- Gardio stuff end ---
 
-# --- UVCP creation start ---
-
-def create_uvcp(pth_path, index_path=None, output_path=None):
-    """Create .uvcp file with properly serialized FAISS index and return a status message."""
-    try:
-        if not Path(pth_path).exists():
-            return f"Error: PTH file not found: {pth_path}"
-
-        pth_data = torch.load(pth_path, map_location="cpu", weights_only=True)
-        uvcp_data = {"model_state": pth_data}
-
-        if index_path:
-            if not Path(index_path).exists():
-                return f"Error: Index file not found: {index_path}"
-            
-            index = faiss.read_index(index_path)
-            uvcp_data["index_data"] = faiss.serialize_index(index)
-
-        # If a custom output path is provided by the user, use it.
-        if output_path:
-            final_output_path = Path(output_path)
-            final_output_path.parent.mkdir(parents=True, exist_ok=True)
-        else:
-            project_root = Path(__file__).resolve().parent.parent.parent.parent
-            logs_dir = project_root / "logs"
-            
-            # Ensure the logs directory exists.
-            logs_dir.mkdir(parents=True, exist_ok=True)
-            
-            # Create the new filename based on the input .pth file.
-            base_name = Path(pth_path).stem
-            uvcp_filename = f"{base_name}.uvcp"
-            final_output_path = logs_dir / uvcp_filename
-            
-        torch.save(uvcp_data, final_output_path)
-        
-        return f"Successfully created UVCP file: {final_output_path}"
-    except Exception as e:
-        return f"An error occurred during UVCP creation: {e}\n{traceback.format_exc()}"
-
 if __name__ == "__main__":
 
     with gr.Blocks() as demo:
-        uvcp_tab()
-
-# --- UVCP creation end ---
\ No newline at end of file
+        uvcp_tab()
\ No newline at end of file